@@ -1,13 +1,44 @@
-
+import argparse
 import logging
-
-from .ui import build_and_run_gui
+import threading
 
 logger = logging.getLogger(__name__)
 
 
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="basic-kvm", description="Minimal KVM client")
+    parser.add_argument("--video", default="0", help="video device path or index (default: 0)")
+    parser.add_argument("--serial", default="/dev/ttyUSB0", help="serial device (default: /dev/ttyUSB0)")
+    parser.add_argument("--baud", type=int, default=9600, help="serial baud rate (default: 9600)")
+    parser.add_argument(
+        "--mjpeg", action="store_true", help="request MJPEG from the capture device (higher resolution/fps over USB 2.0)"
+    )
+    parser.add_argument(
+        "--max-resolution", action="store_true", help="select the highest resolution the capture device supports"
+    )
+    return parser.parse_args(argv)
+
+
 def main(argv=None):
-    return build_and_run_gui()
+    # numpy/cv2 dominate startup; start loading them while the arguments are
+    # parsed and Tk is imported instead of before anything else can run
+    threading.Thread(target=__import__, args=("cv2",), daemon=True).start()
+
+    args = _parse_args(argv)
+    try:
+        video = int(args.video)
+    except ValueError:
+        video = args.video
+
+    from .ui import build_and_run_gui
+
+    return build_and_run_gui(
+        video_device=video,
+        serial_device=args.serial,
+        baud=args.baud,
+        mjpeg=args.mjpeg,
+        max_resolution=args.max_resolution,
+    )
 
 
 if __name__ == "__main__":
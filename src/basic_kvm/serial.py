@@ -1,6 +1,14 @@
 
 
 import logging
+import os
+
+try:
+    import serial
+
+    _Serial = serial.Serial
+except Exception:
+    _Serial = None
 
 logger = logging.getLogger(__name__)
 
@@ -9,19 +17,18 @@ class SerialSender:
 
     If `pyserial` is installed this will use a real serial port, otherwise
     it will log the sent text (useful for development).
+
+    Writes never block: `send_text` queues the bytes and writes what the
+    port accepts right away. Callers on a GUI thread should keep calling
+    `drain()` while `pending` is true.
     """
 
     def __init__(self, device: str = "/dev/ttyUSB0", baud: int = 9600) -> None:
         self.device = device
         self.baud = baud
-        try:
-            import serial
-
-            self._serial = serial.Serial
-        except Exception:
-            self._serial = None
-
+        self._serial = _Serial
         self._conn = None
+        self._tx_buf = bytearray()
 
     def open(self) -> None:
         if self._serial is None:
@@ -34,18 +41,47 @@ class SerialSender:
 
     def send_text(self, text: str) -> None:
         if self._conn is not None:
-            try:
-                # Convert to bytes and write; real devices may expect different encoding
-                self._conn.write(text.encode("utf-8"))
-            except Exception:
-                logger.exception("Failed to write to serial device")
+            # Convert to bytes and queue; real devices may expect different encoding
+            self._tx_buf += text.encode("utf-8")
+            self.drain()
         else:
             logger.info("SerialSender (dry): %s", text)
 
+    @property
+    def is_open(self) -> bool:
+        """True while a real serial connection is open."""
+        return self._conn is not None
+
+    @property
+    def pending(self) -> bool:
+        """True while queued bytes are still waiting to be written."""
+        return bool(self._tx_buf)
+
+    def drain(self) -> bool:
+        """Write as much queued data as the port accepts without blocking.
+
+        Returns True if data is still pending afterwards.
+        """
+        if self._conn is None or not self._tx_buf:
+            return False
+        try:
+            # pyserial opens the port with O_NONBLOCK, so this never waits
+            n = os.write(self._conn.fileno(), self._tx_buf)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except Exception:
+            logger.exception("Failed to write to serial device")
+            self._tx_buf.clear()
+            return False
+        del self._tx_buf[:n]
+        return bool(self._tx_buf)
+
     def close(self) -> None:
+        self._tx_buf.clear()
         if self._conn is not None:
             try:
                 self._conn.close()
             except Exception:
                 pass
+            self._conn = None
 
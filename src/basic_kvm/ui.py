@@ -1,96 +1,353 @@
 
+import glob
 import logging
+import threading
+import time
 import tkinter as tk
-
-from .video import VideoSource, bgr_to_photoimage, enumerate_video_devices
+from tkinter import simpledialog, ttk
+
+from .video import (
+    VideoSource,
+    bgr_to_photoimage,
+    changed_region,
+    enumerate_video_devices,
+    fit_to_view,
+    get_frame_buffer,
+)
 from .serial import SerialSender
 
 logger = logging.getLogger(__name__)
 
+# seconds without a frame before the capture thread gives up on a device;
+# an unplugged one makes read() and grab() fail instead of raising
+_NO_FRAME_TIMEOUT = 5.0
+
 
 class VideoWidget(tk.Frame):
     """A simple Tkinter widget that displays frames from a VideoSource.
 
-    Call `start()` to begin polling frames and `stop()` to stop. The widget
-    keeps a reference to the PhotoImage to avoid garbage collection.
+    Call `start()` to begin polling frames and `stop()` to stop. Frames are
+    read by a background capture thread and handed to the Tk thread through a
+    latest-only slot, so a slow device never blocks the event loop and frames
+    the UI cannot keep up with are dropped instead of queued; arrays nobody
+    needs any more are recycled so OpenCV decodes into existing memory.
+
+    The widget keeps a single PhotoImage (referenced to avoid garbage
+    collection), recreated only when the frame size changes, and only uploads
+    the rectangle that changed between frames, which on a mostly-still
+    console is usually a cursor or a line of text. Its RGBA buffers come from
+    a small pool in the video module that holds just the latest two sizes,
+    since frame sizes follow every resize of the window. Frames larger than
+    the widget are shrunk to fit, keeping aspect ratio.
     """
 
     def __init__(self, master=None, source=None, interval=30, **kwargs):
         super().__init__(master, **kwargs)
         self.source = source or VideoSource(0)
         self.interval = interval
-        self._label = tk.Label(self)
+        # no border or padding, so the image can fill the label exactly
+        self._label = tk.Label(self, borderwidth=0, padx=0, pady=0)
         self._label.pack(fill=tk.BOTH, expand=True)
+        self._label.bind("<Configure>", self._on_configure)
+        # (width, height) available for the image, read by the capture thread;
+        # bounded by the screen until an image has been laid out
+        self._view_size: tuple[int, int] | None = (self.winfo_screenwidth(), self.winfo_screenheight())
         self._photo = None
+        self._frame_buf = None
+        # last displayed frame, diffed against the next one by _show
+        self._prev_frame = None
         self._running = False
+        # True while a _poll callback is scheduled, so there is only ever one
+        self._poll_pending = False
+        # latest (source size, frame) published by the capture thread, and
+        # frame arrays the UI is done with, for OpenCV to decode into again;
+        # both guarded by _lock
+        self._front = None
+        self._spare: list = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._cap_thread: threading.Thread | None = None
+        # (device, thread) of every capture thread started, so one starting on
+        # a device can wait for those still holding it; finished ones are
+        # dropped on the next start
+        self._cap_threads: list[tuple[int | str, threading.Thread]] = []
+        # error message set by the capture thread, shown by _poll
+        self._status: str | None = None
+        self._last_frame_size: tuple[int, int] | None = None
+        # called on the Tk thread with (width, height), or None when unknown
+        self.on_size_change = None
 
     def set_source(self, source: VideoSource) -> None:
         """Replace the current VideoSource with a new one at runtime.
 
-        If the widget is running, this will stop polling, release the old
-        source, set the new one and resume polling.
+        If the widget is running, this will stop polling, set the new source
+        and resume polling once it has opened; the old source is released by
+        its capture thread. A widget whose previous source failed to open is
+        retried as well.
         """
-        was_running = self._running
+        was_running = self._running or self._status is not None
         if was_running:
             self._running = False
-        # release old
-        try:
-            if self.source is not None:
-                self.source.release()
-        except Exception:
-            pass
+            self._stop_capture()
+        self._release_unowned()
         self.source = source
         if was_running:
-            # try to open new source; errors propagate to caller via exceptions
-            try:
-                self.source.open()
-            except Exception:
-                # do not crash the UI; just log and keep widget stopped
-                return
-            self._running = True
-            self._poll()
+            self.start()
 
     def start(self) -> None:
-        opened = self.source.open()
-        if not opened:
-            raise RuntimeError(f"Failed to open video source: {self.source.source}")
+        """Open the source in the background and start displaying frames.
+
+        Opening a V4L2 device can take hundreds of milliseconds, so it runs
+        on the capture thread; a failure is logged and shown in the widget.
+        """
         self._running = True
-        self._poll()
+        self._status = None
+        # keep the PhotoImage; the first frame is pasted into it in full
+        self._prev_frame = None
+        self._set_frame_size(None)
+        self._label.configure(image="", text="Opening video source...")
+        self._start_capture()
+        self._schedule_poll()
+
+    def _start_capture(self) -> None:
+        # threads still stuck on the same device must let go of it first;
+        # compared by device so 0 and "/dev/video0" count as the same node
+        device = self.source.device
+        self._cap_threads = [(d, t) for d, t in self._cap_threads if t.is_alive()]
+        waits = [t for d, t in self._cap_threads if d == device]
+        # each thread gets its own event so a slow one can never be revived
+        self._stop_event = threading.Event()
+        self._cap_thread = threading.Thread(
+            target=self._capture_loop, args=(self.source, self._stop_event, waits), daemon=True
+        )
+        self._cap_threads.append((device, self._cap_thread))
+        self._cap_thread.start()
+
+    def _stop_capture(self) -> None:
+        # not joined: on a device that lost its signal a read can block for
+        # about 10 s, and the thread releases the source itself when it exits
+        self._stop_event.set()
+        # drop any frame left over from the previous source
+        with self._lock:
+            self._front = None
+            self._spare.clear()
+
+    def _release_unowned(self) -> None:
+        """Release the source if no capture thread was ever started for it."""
+        if self._cap_thread is not None or self.source is None:
+            return
+        try:
+            self.source.release()
+        except Exception:
+            pass
+
+    def _capture_loop(
+        self, source: VideoSource, stop: threading.Event, waits: list[threading.Thread]
+    ) -> None:
+        """Run `_capture` and release `source` afterwards.
+
+        The source is only ever touched by this thread, since releasing a
+        VideoCapture while another thread reads from it is unsafe.
+        """
+        try:
+            # reopening a device an old thread still holds would fail
+            for prev in waits:
+                prev.join()
+            if not stop.is_set():
+                self._capture(source, stop)
+        finally:
+            source.release()
+
+    def _capture(self, source: VideoSource, stop: threading.Event) -> None:
+        """Open `source` and read frames until stopped, publishing the newest."""
+        try:
+            opened = source.open()
+        except Exception:
+            logger.exception("Failed to open video source %s", source.source)
+            opened = False
+        if not opened:
+            self._report(stop, f"Failed to open video source: {source.source}")
+            return
+        if stop.is_set():
+            return
+        reuse = None
+        grabbed = False
+        last_frame = time.monotonic()
+        while not stop.is_set():
+            try:
+                if self._front is not None:
+                    # the UI has not taken the last frame yet: keep the driver
+                    # queue drained but only decode once there is a taker
+                    grabbed = source.grab()
+                    if grabbed:
+                        last_frame = time.monotonic()
+                    elif time.monotonic() - last_frame > _NO_FRAME_TIMEOUT:
+                        self._report(stop, f"No frames from video source: {source.source}")
+                        break
+                    else:
+                        stop.wait(0.01)
+                    continue
+                if reuse is None:
+                    with self._lock:
+                        reuse = self._spare.pop() if self._spare else None
+                frame = source.retrieve(reuse) if grabbed else source.read(reuse)
+                grabbed = False
+            except Exception:
+                logger.exception("Failed to read frame from %s", source.source)
+                self._report(stop, f"Failed to read from video source: {source.source}")
+                break
+            if frame is None:
+                if time.monotonic() - last_frame > _NO_FRAME_TIMEOUT:
+                    self._report(stop, f"No frames from video source: {source.source}")
+                    break
+                # avoid spinning on a device that returns no frames
+                stop.wait(0.01)
+                continue
+            last_frame = time.monotonic()
+            reuse = None
+            h, w = frame.shape[:2]
+            # shrink here rather than on the Tk thread; every later stage then
+            # touches only the pixels that are actually shown
+            view = self._view_size
+            if view is not None:
+                # recycled arrays have the shown size, so scale into one
+                with self._lock:
+                    dst = self._spare.pop() if self._spare else None
+                shown = fit_to_view(frame, view, out=dst)
+                if shown is not frame:
+                    # the full-size frame is not published; decode into it again
+                    reuse, frame = frame, shown
+                else:
+                    # frame fits: the spare is a candidate for the next read
+                    reuse = dst
+            with self._lock:
+                if stop.is_set():
+                    # a read that outlived _stop_capture must not reach the
+                    # widget, which may already show another source
+                    break
+                stale, self._front = self._front, ((w, h), frame)
+            # a frame the UI never picked up is recycled straight away
+            if stale is not None:
+                self._recycle(stale[1])
+
+    def _report(self, stop: threading.Event, message: str) -> None:
+        """Set the error `_poll` shows, unless this thread was already stopped."""
+        with self._lock:
+            # checked under the lock _stop_capture takes after setting `stop`
+            if not stop.is_set():
+                self._status = message
+
+    def _recycle(self, frame) -> None:
+        """Hand a frame array nobody references any more back for reuse."""
+        with self._lock:
+            if len(self._spare) < 3:
+                self._spare.append(frame)
+
+    def _schedule_poll(self, elapsed: float = 0.0) -> None:
+        """Schedule the next _poll unless one is already pending.
+
+        `elapsed` is the time the last update took; it is subtracted from the
+        interval so frames are not requested faster than they are displayed.
+        """
+        if self._poll_pending:
+            return
+        self._poll_pending = True
+        delay = max(1, int(self.interval - elapsed * 1000))
+        # run the update only once Tk has drained pending input events
+        self.after(delay, self.after_idle, self._poll)
 
     def _poll(self) -> None:
+        self._poll_pending = False
         if not self._running:
             return
-        frame = self.source.read()
-        if frame is not None:
+        t0 = time.perf_counter()
+        if self._status is not None:
+            logger.error(self._status)
+            self._label.configure(image="", text=self._status)
+            self._running = False
+            return
+        with self._lock:
+            item = self._front
+            self._front = None
+        if item is not None:
+            size, frame = item
+            # record the source frame size for external UI use
+            self._set_frame_size(size)
             try:
-                # record last frame size for external UI use
-                try:
-                    h, w = frame.shape[:2]
-                    self._last_frame_size = (w, h)
-                except Exception:
-                    self._last_frame_size = None
-
-                photo = bgr_to_photoimage(frame)
-                self._photo = photo
-                self._label.configure(image=photo)
+                self._show(frame)
             except Exception:
                 # If conversion fails, ignore for now; higher-level code should log
                 pass
-        self.after(self.interval, self._poll)
+        self._schedule_poll(time.perf_counter() - t0)
+
+    def _show(self, frame) -> None:
+        """Update the persistent PhotoImage, uploading only what changed."""
+        prev, self._prev_frame = self._prev_frame, frame
+        try:
+            self._update_photo(prev, frame)
+        finally:
+            # the previous frame has been diffed; the capture thread may reuse it
+            if prev is not None:
+                self._recycle(prev)
+
+    def _update_photo(self, prev, frame) -> None:
+        h, w = frame.shape[:2]
+        if self._frame_buf is None or self._frame_buf.size != (w, h):
+            # the PhotoImage is only recreated when the resolution changes
+            self._frame_buf = get_frame_buffer(w, h)
+            self._photo = bgr_to_photoimage(frame, out=self._frame_buf)
+            self._label.configure(image=self._photo)
+            return
+        if prev is None:
+            # first frame after (re)starting: redraw everything
+            self._photo.paste(self._frame_buf.load(frame))
+            self._label.configure(image=self._photo)
+            return
+        box = changed_region(prev, frame)
+        if box is None:
+            # mostly-still KVM consoles: nothing to redraw
+            return
+        x0, y0, x1, y1 = box
+        if (x1 - x0) * (y1 - y0) * 4 < w * h:
+            # copy just the dirty rectangle into the displayed photo
+            patch = bgr_to_photoimage(frame[y0:y1, x0:x1])
+            self.tk.call(str(self._photo), "copy", str(patch), "-to", x0, y0)
+        else:
+            self._photo.paste(self._frame_buf.load(frame))
+
+    def _on_configure(self, event) -> None:
+        # while the label only holds the status text it is one line high,
+        # which says nothing about the room an image would get
+        if not self._label.cget("image"):
+            return
+        # ignore the 1x1 size reported before the window is first mapped
+        if event.width > 1 and event.height > 1:
+            self._view_size = (event.width, event.height)
+
+    def _set_frame_size(self, size: tuple[int, int] | None) -> None:
+        if size == self._last_frame_size:
+            return
+        self._last_frame_size = size
+        if self.on_size_change is not None:
+            self.on_size_change(size)
 
     def stop(self) -> None:
         self._running = False
-        try:
-            self.source.release()
-        except Exception:
-            pass
+        self._stop_capture()
+        self._release_unowned()
 
     def last_frame_size(self):
         """Return last captured frame size as (width, height) or None."""
-        return getattr(self, "_last_frame_size", None)
+        return self._last_frame_size
 
 
-def build_and_run_gui(video_device: str | int = 0, serial_device: str = "/dev/ttyUSB0", baud: int = 9600) -> int:
+def build_and_run_gui(
+    video_device: str | int = 0,
+    serial_device: str = "/dev/ttyUSB0",
+    baud: int = 9600,
+    mjpeg: bool = False,
+    max_resolution: bool = False,
+) -> int:
 
     root = tk.Tk()
     root.title("basic-kvm")
@@ -98,7 +355,7 @@ def build_and_run_gui(video_device: str | int = 0, serial_device: str = "/dev/tt
     sender = SerialSender(device=str(serial_device), baud=baud)
     sender.open()
 
-    video_src = VideoSource(video_device)
+    video_src = VideoSource(video_device, mjpeg=mjpeg, prefer_max_resolution=max_resolution)
     widget = VideoWidget(root, source=video_src)
     widget.pack(fill=tk.BOTH, expand=True)
 
@@ -113,13 +370,25 @@ def build_and_run_gui(video_device: str | int = 0, serial_device: str = "/dev/tt
 
     tk.Label(top, text="Video:").pack(side=tk.LEFT)
     dev_var = tk.StringVar(value=str(video_device))
-    devices = enumerate_video_devices()
-    dev_menu = tk.OptionMenu(top, dev_var, *devices)
+    # device lists are probed only when a dropdown is opened, not at startup
+    dev_menu = ttk.Combobox(top, textvariable=dev_var, state="readonly")
+    # paths matching the dropdown entries by index
+    video_paths: list[str] = []
+
+    def refresh_video_devices():
+        nonlocal video_paths
+        names, video_paths = enumerate_video_devices()
+        dev_menu.configure(values=[f"{name} ({path})" for name, path in zip(names, video_paths)])
+
+    dev_menu["postcommand"] = refresh_video_devices
     dev_menu.pack(side=tk.LEFT)
 
     tk.Label(top, text="Serial:").pack(side=tk.LEFT)
     serial_var = tk.StringVar(value=str(serial_device))
-    serial_menu = tk.OptionMenu(top, serial_var, "/dev/ttyUSB0", "/dev/ttyUSB1", "/dev/serial/by-id/usb-CH9329", "none")
+    serial_menu = ttk.Combobox(top, textvariable=serial_var, state="readonly")
+    serial_menu["postcommand"] = lambda: serial_menu.configure(
+        values=sorted(glob.glob("/dev/ttyUSB*")) + sorted(glob.glob("/dev/serial/by-id/*")) + ["none"]
+    )
     serial_menu.pack(side=tk.LEFT)
 
     serial_status = tk.Label(top, text="Serial: closed")
@@ -131,12 +400,24 @@ def build_and_run_gui(video_device: str | int = 0, serial_device: str = "/dev/tt
 
     def update_serial_status():
         nonlocal sender
-        state = "open" if getattr(sender, "_conn", None) is not None else "closed"
+        state = "open" if sender.is_open else "closed"
         serial_status.configure(text=f"Serial: {state}")
         open_close_btn.configure(text="Close Serial" if state == "open" else "Open Serial")
 
+    # pending after() ids used to debounce device changes; an open is costly,
+    # so only act once the selection has settled
+    serial_pending = None
+    video_pending = None
+
     def serial_changed(*_args):
-        nonlocal sender
+        nonlocal serial_pending
+        if serial_pending is not None:
+            root.after_cancel(serial_pending)
+        serial_pending = root.after(200, apply_serial)
+
+    def apply_serial():
+        nonlocal sender, serial_pending
+        serial_pending = None
         new_dev = serial_var.get()
         if new_dev == "none":
             sender.close()
@@ -152,7 +433,7 @@ def build_and_run_gui(video_device: str | int = 0, serial_device: str = "/dev/tt
 
     def toggle_serial():
         nonlocal sender
-        if getattr(sender, "_conn", None) is not None:
+        if sender.is_open:
             sender.close()
         else:
             sender.open()
@@ -163,45 +444,58 @@ def build_and_run_gui(video_device: str | int = 0, serial_device: str = "/dev/tt
 
     def paste_and_send():
         # Simple dialog for text to send
-        from tkinter import simpledialog
         text = simpledialog.askstring("Paste text", "Text to send as keystrokes:")
         if text:
             sender.send_text(text)
+            if sender.pending:
+                root.after(5, drain_serial)
+
+    def drain_serial():
+        # keep writing queued keystrokes without blocking the Tk thread
+        if sender.drain():
+            root.after(5, drain_serial)
 
     paste_btn = tk.Button(top, text="Paste & Send", command=paste_and_send)
     paste_btn.pack(side=tk.LEFT)
 
     def video_changed(*_args):
+        nonlocal video_pending
+        if video_pending is not None:
+            root.after_cancel(video_pending)
+        video_pending = root.after(200, apply_video)
+
+    def apply_video():
+        nonlocal video_pending
+        video_pending = None
         new_dev = dev_var.get()
-        # interpret numeric device indices
-        try:
-            new_src = int(new_dev)
-        except Exception:
-            new_src = new_dev
+        index = dev_menu.current()
+        if 0 <= index < len(video_paths):
+            new_src = video_paths[index]
+        else:
+            # initial value from the command line: a path or numeric index
+            try:
+                new_src = int(new_dev)
+            except Exception:
+                new_src = new_dev
         try:
-            widget.set_source(VideoSource(new_src))
+            widget.set_source(VideoSource(new_src, mjpeg=mjpeg, prefer_max_resolution=max_resolution))
         except Exception:
             logger.exception("Failed to switch video source to %s", new_dev)
 
     dev_var.trace("w", video_changed)
 
-    try:
-        widget.start()
+    def update_resolution(size):
+        if size is None:
+            res_text = "Resolution: N/A"
+        else:
+            w, h = size
+            res_text = f"Resolution: {w}x{h}"
+        res_label.configure(text=res_text)
 
-        def update_resolution():
-            size = widget.last_frame_size()
-            if size is None:
-                res_text = "Resolution: N/A"
-            else:
-                w, h = size
-                res_text = f"Resolution: {w}x{h}"
-            try:
-                res_label.configure(text=res_text)
-            except Exception:
-                pass
-            root.after(500, update_resolution)
+    widget.on_size_change = update_resolution
 
-        root.after(500, update_resolution)
+    try:
+        widget.start()
         root.mainloop()
     finally:
         widget.stop()
@@ -1,31 +1,119 @@
 
 import cv2
+import fcntl
 import glob
+import json
+import logging
+import os
+import struct
+
 import numpy as np
 
+try:
+    from PIL import Image, ImageTk
+except Exception:  # pragma: no cover - optional dependency
+    Image = ImageTk = None
+
+logger = logging.getLogger(__name__)
+
+# resolutions chosen by earlier probes, keyed by device identity
+_RESOLUTION_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "basic-kvm", "resolutions.json"
+)
+
 class VideoSource:
 
-    def __init__(self, source: int | str = 0) -> None:
+    def __init__(self, source: int | str = 0, *, mjpeg: bool = False, prefer_max_resolution: bool = False) -> None:
         self.source = source
+        # ask the device for MJPEG; OpenCV still decodes it to BGR
+        self.mjpeg = mjpeg
+        # select the highest supported resolution on open; off by default
+        # because even the fast path costs a few driver round-trips
+        self.prefer_max_resolution = prefer_max_resolution
         self._cap = None
 
+    @property
+    def device(self) -> int | str:
+        """The device behind `source`; the same for every name of a V4L2 node."""
+        return _v4l2_path(self.source) or self.source
+
     def open(self) -> bool:
-        """Open the underlying capture device. Returns True if opened."""
+        """Open the underlying capture device. Returns True if opened.
+
+        Calling it again while the device is open does nothing.
+        """
+        if self._cap is not None:
+            if self._cap.isOpened():
+                return True
+            self._cap.release()
         self._cap = cv2.VideoCapture(self.source)
         opened = bool(self._cap.isOpened())
         if not opened:
             return False
+        if self.mjpeg:
+            # must be set before any frame size; drivers without MJPEG ignore it
+            self._cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        if self.prefer_max_resolution:
+            self._apply_max_resolution()
         return True
 
-    def _choose_max_resolution(self) -> None:
-        """Probe common resolutions from largest to smallest and select the
-        highest one that the device actually delivers.
+    def _frame_size(self) -> tuple[int, int]:
+        return (
+            int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0),
+            int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0),
+        )
+
+    def _fourcc(self) -> int:
+        """The pixel format being captured in, as a V4L2/OpenCV fourcc code."""
+        return int(self._cap.get(cv2.CAP_PROP_FOURCC) or 0)
+
+    def _apply_max_resolution(self) -> None:
+        """Set the resolution remembered for this device and pixel format,
+        probing only when there is none yet or the device no longer accepts it.
+        """
+        # devices usually offer larger sizes in MJPG than in raw formats
+        key = f"{_device_key(self.source)}:{_fourcc_str(self._fourcc()) or 'default'}"
+        cached = _load_resolutions().get(key)
+        if cached:
+            w, h = cached
+            self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, float(w))
+            self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, float(h))
+            if self._frame_size() == (w, h):
+                return
+        # a probe that matched nothing left the old size, which is no maximum
+        if self._choose_max_resolution():
+            _save_resolution(key, self._frame_size())
+
+    def _choose_max_resolution(self) -> bool:
+        """Select the highest resolution the device supports.
+
+        For V4L2 nodes the sizes offered in the current pixel format (MJPG
+        with `mjpeg`, otherwise the driver's default) are read with one ioctl
+        loop and the largest is set directly. Other sources, or drivers whose reported
+        size does not stick, fall back to probing common resolutions from
+        largest to smallest; each is accepted when the driver reports it, or
+        when a single frame read at that setting has that size.
 
-        This will attempt to set the capture properties and verify by reading
-        a frame. It is robust to drivers that ignore property sets.
+        Returns True if a size was selected, False if the previous one was
+        restored.
         """
         if self._cap is None:
-            return
+            return False
+
+        path = _v4l2_path(self.source)
+        # only the sizes of the format being captured in can be set
+        fourcc = self._fourcc()
+        if path is not None and fourcc:
+            try:
+                size = _max_frame_size(path, fourcc)
+            except OSError:
+                size = None
+            if size is not None:
+                w, h = size
+                self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, float(w))
+                self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, float(h))
+                if self._frame_size() == size:
+                    return True
 
         # Common resolutions, from largest to smallest
         candidates = [
@@ -54,18 +142,13 @@ class VideoSource:
             except Exception:
                 continue
 
-            # read a few frames to let the device settle
-            got = False
-            for _ in range(3):
-                ret, frame = self._cap.read()
-                if not ret or frame is None:
-                    continue
-                fh, fw = frame.shape[:2]
-                if fw == w and fh == h:
-                    got = True
-                    break
-            if got:
-                return
+            # well-behaved drivers report the negotiated size right away
+            if self._frame_size() == (w, h):
+                return True
+            # otherwise check what one frame actually delivers
+            ret, frame = self._cap.read()
+            if ret and frame is not None and frame.shape[1::-1] == (w, h):
+                return True
 
         # none matched; try to restore previous settings if available
         try:
@@ -74,12 +157,35 @@ class VideoSource:
                 self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, float(cur_h))
         except Exception:
             pass
+        return False
+
+    def read(self, out=None):
+        """Read one BGR frame from the device. Returns None if no frame.
+
+        If `out` is an array of the right shape and dtype, OpenCV decodes
+        into it and returns it instead of allocating a new frame.
+        """
+        if self._cap is None:
+            raise RuntimeError("Video source is not opened")
+        ret, frame = self._cap.read(out)
+        if not ret:
+            return None
+        return frame
 
-    def read(self):
-        """Read one BGR frame from the device. Returns None if no frame."""
+    def grab(self) -> bool:
+        """Advance to the next frame without decoding it. Returns True on success."""
+        if self._cap is None:
+            raise RuntimeError("Video source is not opened")
+        return bool(self._cap.grab())
+
+    def retrieve(self, out=None):
+        """Decode the frame taken by the last `grab()`. Returns None if none.
+
+        `out` is reused as in `read()`.
+        """
         if self._cap is None:
             raise RuntimeError("Video source is not opened")
-        ret, frame = self._cap.read()
+        ret, frame = self._cap.retrieve(out)
         if not ret:
             return None
         return frame
@@ -93,45 +199,296 @@ class VideoSource:
             self._cap = None
 
 
-def bgr_to_photoimage(frame):
+class FrameBuffer:
+    """A reusable RGBA pixel buffer and the Pillow image that maps it.
+
+    Pillow only shares memory with a buffer for a few modes (RGBA, not RGB),
+    so frames are converted to RGBA; the image then always reflects the
+    latest `load()` without any per-frame allocation.
+    """
+
+    def __init__(self, width: int, height: int) -> None:
+        if Image is None:
+            raise ImportError("Pillow is required to convert frames to PhotoImage")
+
+        self.size = (width, height)
+        self.array = np.empty((height, width, 4), dtype=np.uint8)
+        self.image = Image.frombuffer("RGBA", self.size, self.array, "raw", "RGBA", 0, 1)
+
+    def load(self, frame):
+        """Convert a BGR frame of matching size into the buffer; return the image."""
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=self.array)
+        return self.image
+
+
+# FrameBuffers by (width, height), least recently used first; see
+# get_frame_buffer()
+_frame_buffers: dict[tuple[int, int], FrameBuffer] = {}
+# frames follow the window size, so every resize step is a new size; keep
+# the current and previous one, enough to switch back and forth cheaply
+_MAX_FRAME_BUFFERS = 2
+
+
+def get_frame_buffer(width: int, height: int) -> FrameBuffer:
+    """Return the shared FrameBuffer for this size, creating it on first use.
+
+    The buffer is shared by every caller: its image is only valid until the
+    next `load()`, so copy it out (e.g. into a PhotoImage) right away. Only
+    the most recently used sizes are kept.
+    """
+    buf = _frame_buffers.pop((width, height), None)
+    if buf is None:
+        buf = FrameBuffer(width, height)
+    _frame_buffers[(width, height)] = buf
+    while len(_frame_buffers) > _MAX_FRAME_BUFFERS:
+        del _frame_buffers[next(iter(_frame_buffers))]
+    return buf
+
+
+def bgr_to_photoimage(frame, out: FrameBuffer | None = None):
     """Convert a BGR NumPy frame to a Tkinter PhotoImage using Pillow.
 
+    If `out` is a FrameBuffer of the same size as `frame`, the conversion is
+    written into it instead of allocating new buffers; it may be reused as
+    soon as this returns, since PhotoImage copies the pixels.
+
     Raises ImportError if Pillow is not installed.
     """
-    try:
-        from PIL import Image, ImageTk
-    except Exception as exc:  # pragma: no cover - optional dependency
-        raise ImportError("Pillow is required to convert frames to PhotoImage") from exc
+    if ImageTk is None:
+        raise ImportError("Pillow is required to convert frames to PhotoImage")
 
     if np is None:
         raise RuntimeError("NumPy is required for frame conversion")
 
-    # Convert BGR (OpenCV) to RGB
-    rgb = frame[..., ::-1]
-    img = Image.fromarray(rgb)
+    h, w = frame.shape[:2]
+    if out is not None and out.size == (w, h):
+        img = out.load(frame)
+    else:
+        # Convert BGR (OpenCV) to RGBA, which Pillow can map without a copy
+        rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+        img = Image.frombuffer("RGBA", (w, h), rgba, "raw", "RGBA", 0, 1)
     return ImageTk.PhotoImage(image=img)
 
-def enumerate_video_devices():
-
-    import fcntl
-    import os
-    import videodev2 # type: ignore
-
-    paths = sorted(glob.glob("/dev/video*"))
-    devices = []
-    for dev in paths:
-        fd = os.open(dev, os.O_RDONLY | os.O_NONBLOCK)
-        cap = videodev2.v4l2_capability()
-        fcntl.ioctl(fd, videodev2.VIDIOC_QUERYCAP, cap)
-        caps = int(cap.device_caps)
-        if not (caps & videodev2.V4L2_CAP_VIDEO_CAPTURE):
-            # skip non-video-capture devices (e.g., metadata-only)
-            continue
-        # get card name (bytes) and decode
-        name = bytes(cap.card).decode("utf-8", errors="ignore").rstrip('\x00')
-        # strip duplicated name after colon
-        name = name.split(":")[0].strip()
-        devices.append((name, dev))
+def fit_to_view(frame, size: tuple[int, int], out=None):
+    """Downscale `frame` to fit within `size` (width, height), keeping its
+    aspect ratio. Frames that already fit are returned unchanged.
+
+    If `out` is an array of the resulting shape and dtype, the scaled frame
+    is written into it instead of a new allocation; otherwise it is ignored.
+    """
+    h, w = frame.shape[:2]
+    scale = min(size[0] / w, size[1] / h)
+    if scale >= 1.0:
+        return frame
+    dsize = (max(1, int(w * scale)), max(1, int(h * scale)))
+    expected = (dsize[1], dsize[0]) + frame.shape[2:]
+    if out is not None and (out.shape != expected or out.dtype != frame.dtype):
+        out = None
+    # INTER_AREA averages source pixels, which keeps console text legible
+    return cv2.resize(frame, dsize, dst=out, interpolation=cv2.INTER_AREA)
+
+
+def changed_region(prev, frame) -> tuple[int, int, int, int] | None:
+    """Return the (x0, y0, x1, y1) bounding box where `frame` differs from
+    `prev`, or None if they are identical. Both must have the same shape.
+    """
+    h = frame.shape[0]
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    diff = cv2.absdiff(prev, frame)
+    # treat each row as one long channel-interleaved line so boundingRect
+    # can scan the whole difference image in a single call
+    x, y, bw, bh = cv2.boundingRect(diff.reshape(h, -1))
+    if bw == 0 or bh == 0:
+        return None
+    return x // channels, y, (x + bw + channels - 1) // channels, y + bh
+
+
+# struct v4l2_capability is 104 bytes: driver[16], card[32], bus_info[32],
+# then u32 version, capabilities and device_caps
+_VIDIOC_QUERYCAP = 0x80685600  # _IOR('V', 0, struct v4l2_capability)
+_V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+_V4L2_CAP_DEVICE_CAPS = 0x80000000
+
+
+def _cstr(raw: bytes) -> bytes:
+    """Cut a fixed-size, NUL-padded kernel string at its first NUL."""
+    return raw.split(b"\x00", 1)[0]
+
+
+def _querycap(fd: int) -> tuple[bytes, bytes, int]:
+    """Issue VIDIOC_QUERYCAP on `fd` and return (card, bus_info, capabilities)."""
+    buf = bytearray(104)
+    fcntl.ioctl(fd, _VIDIOC_QUERYCAP, buf)
+    capabilities, device_caps = struct.unpack_from("=II", buf, 84)
+    # device_caps describes this node; capabilities covers the whole device
+    if capabilities & _V4L2_CAP_DEVICE_CAPS:
+        capabilities = device_caps
+    return bytes(buf[16:48]), bytes(buf[48:80]), capabilities
+
+
+# struct v4l2_frmsizeenum is 44 bytes: index, pixel_format, type, then a
+# union of discrete (width, height) or stepwise (min/max/step per axis)
+_VIDIOC_ENUM_FRAMESIZES = 0xC02C564A  # _IOWR('V', 74, struct v4l2_frmsizeenum)
+_V4L2_FRMSIZE_TYPE_DISCRETE = 1
+# largest size worth selecting; matches the top of the probe list
+_MAX_FRAME_SIZE = (3840, 2160)
+
+
+def _v4l2_path(source: int | str) -> str | None:
+    """Return the /dev/video* node for `source`, or None if it is not one.
+
+    Symlinks such as /dev/v4l/by-id/... are resolved to the node they name.
+    """
+    if isinstance(source, int):
+        return f"/dev/video{source}"
+    path = os.path.realpath(source)
+    if path.startswith("/dev/video"):
+        return path
+    return None
+
+
+def _frame_sizes(fd: int, pixelformat: int):
+    """Yield every (width, height) the capture node at `fd` advertises for
+    `pixelformat`; nothing if the node does not support that format.
+    """
+    frm = bytearray(44)
+    for size_index in range(256):
+        struct.pack_into("=II", frm, 0, size_index, pixelformat)
+        try:
+            fcntl.ioctl(fd, _VIDIOC_ENUM_FRAMESIZES, frm)
+        except OSError:
+            # EINVAL marks the end of the list
+            return
+        (kind,) = struct.unpack_from("=I", frm, 8)
+        if kind == _V4L2_FRMSIZE_TYPE_DISCRETE:
+            yield struct.unpack_from("=II", frm, 12)
+        else:
+            # continuous/stepwise: a single entry giving the range
+            _min_w, max_w, _step_w, _min_h, max_h, _step_h = struct.unpack_from("=6I", frm, 12)
+            yield min(max_w, _MAX_FRAME_SIZE[0]), min(max_h, _MAX_FRAME_SIZE[1])
+            return
+
+
+def _max_frame_size(path: str, pixelformat: int) -> tuple[int, int] | None:
+    """Return the largest frame size of `path` in `pixelformat` up to 4K, or None."""
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        sizes = [
+            (w, h)
+            for w, h in _frame_sizes(fd, pixelformat)
+            if w <= _MAX_FRAME_SIZE[0] and h <= _MAX_FRAME_SIZE[1]
+        ]
+    finally:
+        os.close(fd)
+    if not sizes:
+        return None
+    return max(sizes, key=lambda size: size[0] * size[1])
+
+
+def _fourcc_str(code: int) -> str:
+    """Spell a fourcc code as its four characters, e.g. "MJPG"; "" for 0."""
+    if not code:
+        return ""
+    return bytes((code >> shift) & 0xFF for shift in (0, 8, 16, 24)).decode("ascii", errors="replace")
+
+
+def _device_key(source: int | str) -> str:
+    """Identify the device behind `source` across renumbering of /dev/video*."""
+    path = _v4l2_path(source)
+    if path is None:
+        return str(source)
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            card, bus_info, _caps = _querycap(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        return path
+    card_s = _cstr(card).decode("utf-8", errors="ignore")
+    bus_s = _cstr(bus_info).decode("utf-8", errors="ignore")
+    return f"{card_s}@{bus_s}"
+
+
+def _load_resolutions() -> dict:
+    try:
+        with open(_RESOLUTION_CACHE, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_resolution(key: str, size: tuple[int, int]) -> None:
+    data = _load_resolutions()
+    data[key] = list(size)
+    tmp = _RESOLUTION_CACHE + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(_RESOLUTION_CACHE), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, _RESOLUTION_CACHE)
+    except OSError:
+        logger.debug("Could not write resolution cache %s", _RESOLUTION_CACHE, exc_info=True)
+
+
+# (path, inode, mtime_ns) -> device name, or None for non-capture nodes
+_dev_cache: dict[tuple, str | None] = {}
+
+
+def _video_node_paths() -> list[str]:
+    """Return the /dev/video* paths, listed from sysfs when available."""
+    try:
+        with os.scandir("/sys/class/video4linux") as it:
+            nodes = [e.name for e in it if e.name.startswith("video")]
+    except OSError:
+        return sorted(glob.glob("/dev/video*"))
+    return sorted("/dev/" + n for n in nodes)
+
+
+def _query_capture_name(dev: str) -> str | None:
+    """Return the card name of a capture node, or None if it cannot capture."""
+    fd = os.open(dev, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        card, _bus_info, caps = _querycap(fd)
+    finally:
         os.close(fd)
+    if not (caps & _V4L2_CAP_VIDEO_CAPTURE):
+        # skip non-video-capture devices (e.g., metadata-only)
+        return None
+    # strip duplicated name after colon, on bytes, then decode once
+    return _cstr(card).split(b":", 1)[0].strip().decode("utf-8", errors="ignore")
+
+
+def enumerate_video_devices() -> tuple[list[str], list[str]]:
+    """Return parallel lists (names, paths) of the video capture devices.
+
+    Nodes are listed with a single directory scan, and each node's query
+    result is cached by (path, inode, mtime), so only nodes that appeared
+    or were recreated by udev since the last call are opened.
+    """
+    global _dev_cache
+
+    cache = {}
+    names = []
+    devs = []
+    for dev in _video_node_paths():
+        try:
+            st = os.stat(dev)
+        except OSError:
+            continue
+        key = (dev, st.st_ino, st.st_mtime_ns)
+        if key in _dev_cache:
+            name = _dev_cache[key]
+        else:
+            try:
+                name = _query_capture_name(dev)
+            except OSError:
+                continue
+        cache[key] = name
+        if name is not None:
+            names.append(name)
+            devs.append(dev)
 
-    return devices
+    _dev_cache = cache
+    return names, devs
@@ -0,0 +1,77 @@
+import fcntl
+import os
+import pty
+import tty
+
+import pytest
+
+from basic_kvm.serial import SerialSender
+
+
+class _PtyConn:
+    """Stands in for a pyserial port: a raw, non-blocking pty end."""
+
+    def __init__(self, fd):
+        self._fd = fd
+
+    def fileno(self):
+        return self._fd
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def port():
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    flags = fcntl.fcntl(slave, fcntl.F_GETFL)
+    fcntl.fcntl(slave, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    sender = SerialSender(device="pty")
+    sender._conn = _PtyConn(slave)
+    yield sender, master
+    os.close(master)
+    os.close(slave)
+
+
+def _read_available(fd):
+    os.set_blocking(fd, False)
+    chunks = []
+    try:
+        while True:
+            chunks.append(os.read(fd, 65536))
+    except BlockingIOError:
+        pass
+    return b"".join(chunks)
+
+
+def test_send_text_writes_immediately(port):
+    sender, master = port
+    sender.send_text("hello")
+    assert not sender.pending
+    assert _read_available(master) == b"hello"
+
+
+def test_drain_keeps_unwritten_bytes_in_order(port):
+    sender, master = port
+    data = bytes(range(256)) * 4096  # 1 MiB, far more than a pty buffers
+    sender._tx_buf += data
+    assert sender.drain()
+    assert sender.pending
+
+    received = bytearray()
+    while sender.pending:
+        received += _read_available(master)
+        sender.drain()
+    received += _read_available(master)
+    assert bytes(received) == data
+
+
+def test_close_drops_pending_bytes(port):
+    sender, _master = port
+    sender._tx_buf += b"x" * (1 << 20)
+    sender.drain()
+    sender.close()
+    assert not sender.pending
+    assert not sender.is_open
+    assert not sender.drain()
@@ -0,0 +1,163 @@
+import errno
+import struct
+
+import numpy as np
+
+from basic_kvm import video
+from basic_kvm.video import changed_region
+
+
+def _frames(h=3, w=5, channels=3):
+    prev = np.zeros((h, w, channels), dtype=np.uint8)
+    return prev, prev.copy()
+
+
+def test_changed_region_identical_frames():
+    prev, frame = _frames()
+    assert changed_region(prev, frame) is None
+
+
+def test_changed_region_last_channel_of_last_column():
+    prev, frame = _frames()
+    frame[1, 4, 2] = 7
+    assert changed_region(prev, frame) == (4, 1, 5, 2)
+
+
+def test_changed_region_first_channel_of_first_column():
+    prev, frame = _frames()
+    frame[0, 0, 0] = 1
+    assert changed_region(prev, frame) == (0, 0, 1, 1)
+
+
+def test_changed_region_spans_partial_pixels():
+    prev, frame = _frames()
+    # last channel of column 1 and first channel of column 3
+    frame[0, 1, 2] = 1
+    frame[2, 3, 0] = 1
+    assert changed_region(prev, frame) == (1, 0, 4, 3)
+
+
+def test_changed_region_single_channel():
+    prev = np.zeros((4, 6), dtype=np.uint8)
+    frame = prev.copy()
+    frame[3, 5] = 255
+    assert changed_region(prev, frame) == (5, 3, 6, 4)
+
+
+_YUYV = 0x56595559
+_MJPG = 0x47504A4D
+
+
+class _FakeV4L2:
+    """Answers VIDIOC_ENUM_FRAMESIZES like a driver would."""
+
+    def __init__(self, formats):
+        # {pixelformat: [frmsizeenum payload as (type, *values)]}
+        self.formats = formats
+        self.calls = 0
+
+    def ioctl(self, fd, request, buf):
+        self.calls += 1
+        assert request == video._VIDIOC_ENUM_FRAMESIZES and len(buf) == 44
+        index, pixelformat = struct.unpack_from("=II", buf, 0)
+        sizes = self.formats.get(pixelformat, [])
+        if index >= len(sizes):
+            raise OSError(errno.EINVAL, "end of list")
+        kind, *values = sizes[index]
+        struct.pack_into(f"=I{len(values)}I", buf, 8, kind, *values)
+        return 0
+
+
+def test_v4l2_request_codes_match_struct_sizes():
+    assert video._VIDIOC_QUERYCAP == (2 << 30) | (104 << 16) | (ord("V") << 8) | 0
+    assert video._VIDIOC_ENUM_FRAMESIZES == (3 << 30) | (44 << 16) | (ord("V") << 8) | 74
+
+
+def test_frame_sizes_only_lists_the_requested_format(monkeypatch):
+    fake = _FakeV4L2({
+        _YUYV: [(1, 640, 480), (1, 1280, 720)],
+        _MJPG: [(1, 1280, 720), (1, 1920, 1080)],
+    })
+    monkeypatch.setattr(video, "fcntl", fake)
+    assert list(video._frame_sizes(3, _YUYV)) == [(640, 480), (1280, 720)]
+    assert list(video._frame_sizes(3, _MJPG)) == [(1280, 720), (1920, 1080)]
+    assert list(video._frame_sizes(3, 0x34363248)) == []  # H264, not offered
+
+
+def test_frame_sizes_stepwise_is_clamped(monkeypatch):
+    # min 32x32, max 8192x4320, step 2
+    fake = _FakeV4L2({_YUYV: [(3, 32, 8192, 2, 32, 4320, 2)]})
+    monkeypatch.setattr(video, "fcntl", fake)
+    assert list(video._frame_sizes(3, _YUYV)) == [video._MAX_FRAME_SIZE]
+    # a stepwise range is a single entry; no further ioctl after it
+    assert fake.calls == 1
+
+
+def test_v4l2_path_resolves_symlinks(tmp_path):
+    link = tmp_path / "usb-Capture-video-index0"
+    link.symlink_to("/dev/video2")
+    assert video._v4l2_path(str(link)) == "/dev/video2"
+    assert video._v4l2_path(0) == "/dev/video0"
+    assert video._v4l2_path("rtsp://camera/stream") is None
+
+
+def test_frame_buffer_pool_keeps_recent_sizes(monkeypatch):
+    monkeypatch.setattr(video, "_frame_buffers", {})
+    first = video.get_frame_buffer(640, 480)
+    video.get_frame_buffer(800, 600)
+    assert video.get_frame_buffer(640, 480) is first
+    # a third size evicts the least recently used one, 800x600
+    video.get_frame_buffer(1024, 768)
+    assert list(video._frame_buffers) == [(640, 480), (1024, 768)]
+
+
+def test_fit_to_view_scales_into_matching_out():
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    out = np.empty((360, 640, 3), dtype=np.uint8)
+    assert video.fit_to_view(frame, (640, 480), out=out) is out
+    # a spare of another size is ignored rather than resized in place
+    other = np.empty((240, 320, 3), dtype=np.uint8)
+    shown = video.fit_to_view(frame, (640, 480), out=other)
+    assert shown is not other and shown.shape == (360, 640, 3)
+    # frames that already fit come back untouched
+    assert video.fit_to_view(out, (640, 480)) is out
+
+
+class _FakeCapture:
+    """A VideoCapture that accepts any size up to the maximum of its format."""
+
+    def __init__(self, fourcc, max_size):
+        self.fourcc = fourcc
+        self.max_size = max_size
+        self.size = [640, 480]
+
+    def set(self, prop, value):
+        if prop == video.cv2.CAP_PROP_FRAME_WIDTH and value <= self.max_size[0]:
+            self.size[0] = int(value)
+        elif prop == video.cv2.CAP_PROP_FRAME_HEIGHT and value <= self.max_size[1]:
+            self.size[1] = int(value)
+        return True
+
+    def get(self, prop):
+        if prop == video.cv2.CAP_PROP_FOURCC:
+            return float(self.fourcc)
+        return float(self.size[0] if prop == video.cv2.CAP_PROP_FRAME_WIDTH else self.size[1])
+
+    def read(self, out=None):
+        return False, None
+
+
+def test_max_resolution_is_cached_per_pixel_format(tmp_path, monkeypatch):
+    monkeypatch.setattr(video, "_RESOLUTION_CACHE", str(tmp_path / "resolutions.json"))
+    source = video.VideoSource("rtsp://camera/stream", prefer_max_resolution=True)
+
+    source._cap = _FakeCapture(_YUYV, (1280, 720))
+    source._apply_max_resolution()
+    source._cap = _FakeCapture(_MJPG, (1920, 1080))
+    source._apply_max_resolution()
+    assert source._frame_size() == (1920, 1080)
+
+    assert video._load_resolutions() == {
+        "rtsp://camera/stream:YUYV": [1280, 720],
+        "rtsp://camera/stream:MJPG": [1920, 1080],
+    }